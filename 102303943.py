@@ -5,14 +5,45 @@ Downloads videos from YouTube, converts to audio, cuts and merges them.
 
 Usage:
 python 102303943.py "SingerName" 20 25 output.mp3
+python 102303943.py "SingerName" 20 25 output.mp3 --profile[=trace.json]
+python 102303943.py "SingerName" 20 25 output.mp3 --local=music_dir
 """
 
 import sys
 import os
-import shutil
+import logging
 import traceback
-from pytubefix import YouTube, Search
-from moviepy.editor import AudioFileClip, concatenate_audioclips
+from engine import MashupEngine, MashupError, FINGERPRINT_CACHE
+from profiling import Profiler
+
+
+# --------------------------------------------------
+# Optional Flags
+# --------------------------------------------------
+def parse_flags(args):
+    """Strip --profile[=trace.json] and --local=DIR from args.
+
+    Returns (args, trace_path or None, local_dir or None).
+    """
+    remaining = []
+    trace_path = None
+    local_dir = None
+
+    for arg in args:
+        if arg == "--profile":
+            trace_path = ""
+        elif arg.startswith("--profile="):
+            trace_path = arg.split("=", 1)[1]
+        elif arg.startswith("--local="):
+            local_dir = arg.split("=", 1)[1]
+        else:
+            remaining.append(arg)
+
+    # Default trace lives next to the output file
+    if trace_path == "" and len(remaining) == 5:
+        trace_path = os.path.splitext(remaining[4])[0] + ".profile.json"
+
+    return remaining, trace_path, local_dir
 
 
 # --------------------------------------------------
@@ -20,7 +51,7 @@ from moviepy.editor import AudioFileClip, concatenate_audioclips
 # --------------------------------------------------
 def validate_arguments(args):
     if len(args) != 5:
-        print("Usage: python <file.py> <SingerName> <NumberOfVideos> <AudioDuration> <OutputFileName>")
+        print("Usage: python <file.py> <SingerName> <NumberOfVideos> <AudioDuration> <OutputFileName> [--profile[=trace.json]] [--local=DIR]")
         return False
 
     try:
@@ -49,172 +80,84 @@ def validate_arguments(args):
 
 
 # --------------------------------------------------
-# Download Videos
+# MAIN
 # --------------------------------------------------
-def download_videos(singer_name, num_videos):
-    print("\nSearching YouTube...\n")
-
-    try:
-        search = Search(singer_name)
-        video_urls = []
-        count = 0
-
-        print(f"Fetching top {num_videos} videos...\n")
-
-        for result in search.results:
-            if count >= num_videos:
-                break
-
-            # ONLY collect real videos
-            if hasattr(result, "watch_url"):
-                video_urls.append(result.watch_url)
-                print(f"[{count+1}/{num_videos}] Found: {result.title[:60]}...")
-                count += 1
-
-        if not video_urls:
-            print("No valid videos found.")
-            return []
-
-        print("\nDownloading audio...\n")
-
-        temp_dir = "temp_downloads"
-        os.makedirs(temp_dir, exist_ok=True)
+def report_profile(profiler, trace_path):
+    profiler.stop()
 
-        audio_files = []
+    print("\n===== TIMINGS =====")
+    print(profiler.summary())
 
-        for i, url in enumerate(video_urls):
-            try:
-                print(f"[{i+1}/{len(video_urls)}] Downloading...")
+    if trace_path:
+        profiler.write(trace_path)
+        print("Profile trace saved as:", trace_path)
 
-                yt = YouTube(url)
-                audio_stream = yt.streams.filter(only_audio=True).first()
 
-                if audio_stream:
-                    output_path = audio_stream.download(
-                        output_path=temp_dir,
-                        filename=f"audio_{i}.mp4"
-                    )
-                    audio_files.append(output_path)
-                    print("   ✓ Downloaded")
-                else:
-                    print("   ✗ No audio stream")
-
-            except Exception as e:
-                print("   ✗ Download failed:", e)
-
-        return audio_files
-
-    except Exception as e:
-        print("Error during search/download:", e)
-        traceback.print_exc()
-        return []
-
-
-# --------------------------------------------------
-# Convert & Cut Audio
-# --------------------------------------------------
-def convert_and_cut_audio(audio_files, duration):
-    print("\nProcessing audio files...\n")
-
-    clips = []
+def main():
+    args, trace_path, local_dir = parse_flags(sys.argv)
 
-    for i, file in enumerate(audio_files):
-        try:
-            print(f"[{i+1}/{len(audio_files)}] Processing...")
+    if not validate_arguments(args):
+        sys.exit(1)
 
-            audio = AudioFileClip(file)
+    singer_name = args[1]
+    num_videos = int(args[2])
+    duration = int(args[3])
+    output_filename = args[4]
 
-            if audio.duration > duration:
-                audio = audio.subclip(0, duration)
+    # Engine progress goes to the console as plain lines
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
 
-            clips.append(audio)
-            print("   ✓ Done")
+    profiler = Profiler(capture=trace_path is not None)
+    profiler.start(
+        singer=singer_name,
+        videos=num_videos,
+        duration=duration,
+        output=output_filename
+    )
 
-        except Exception as e:
-            print("   ✗ Error:", e)
+    print("\n===== YOUTUBE MASHUP CREATOR =====")
+    print("Singer:", singer_name)
+    print("Videos:", num_videos)
+    print("Clip Duration:", duration)
+    print("Output:", output_filename)
+    if local_dir:
+        print("Source:", local_dir)
+    print()
 
-    return clips
+    if local_dir:
+        engine = MashupEngine.local(local_dir, fingerprint_path=FINGERPRINT_CACHE)
+    else:
+        engine = MashupEngine(fingerprint_path=FINGERPRINT_CACHE)
 
+    success = False
 
-# --------------------------------------------------
-# Merge Audio
-# --------------------------------------------------
-def merge_audio_clips(clips, output_filename):
     try:
-        print("\nMerging clips...\n")
-
-        final_clip = concatenate_audioclips(clips)
-
-        final_clip.write_audiofile(
-            output_filename,
-            codec="libmp3lame",
-            bitrate="192k",
-            logger=None
-        )
-
-        final_clip.close()
-        for clip in clips:
-            clip.close()
+        result = engine.create_mashup(singer_name, num_videos, duration, output_filename, profiler)
 
         print("\n✓ Mashup created successfully!")
-        print("Saved as:", output_filename)
+        print("Saved as:", result.output_filename)
+        print(f"Clips: {result.clips}, Total duration: {result.duration:.1f} seconds")
+
+        success = True
 
-        return True
+    except MashupError as e:
+        print("\nError:", e)
 
     except Exception as e:
-        print("Error merging:", e)
+        print("Error creating mashup:", e)
         traceback.print_exc()
-        return False
-
 
-# --------------------------------------------------
-# Cleanup
-# --------------------------------------------------
-def cleanup():
-    if os.path.exists("temp_downloads"):
-        shutil.rmtree("temp_downloads")
+    finally:
+        engine.close()
         print("Temporary files cleaned.")
 
-
-# --------------------------------------------------
-# MAIN
-# --------------------------------------------------
-def main():
-    if not validate_arguments(sys.argv):
-        sys.exit(1)
-
-    singer_name = sys.argv[1]
-    num_videos = int(sys.argv[2])
-    duration = int(sys.argv[3])
-    output_filename = sys.argv[4]
-
-    print("\n===== YOUTUBE MASHUP CREATOR =====")
-    print("Singer:", singer_name)
-    print("Videos:", num_videos)
-    print("Clip Duration:", duration)
-    print("Output:", output_filename)
-
-    audio_files = download_videos(singer_name, num_videos)
-
-    if not audio_files:
-        print("\nNo videos downloaded.")
-        sys.exit(1)
-
-    clips = convert_and_cut_audio(audio_files, duration)
-
-    if not clips:
-        print("\nNo clips processed.")
-        cleanup()
-        sys.exit(1)
-
-    success = merge_audio_clips(clips, output_filename)
-
-    cleanup()
+    report_profile(profiler, trace_path)
 
     if success:
         print("\n✓ COMPLETED SUCCESSFULLY")
     else:
         print("\n✗ FAILED")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
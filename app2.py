@@ -4,8 +4,7 @@ With better error handling and email debugging
 """
 
 from flask import Flask, render_template, request, jsonify
-from pytubefix import YouTube, Search
-from moviepy.editor import AudioFileClip, concatenate_audioclips
+from engine import MashupEngine, MashupError, FINGERPRINT_CACHE
 import os
 import smtplib
 from email.mime.multipart import MIMEMultipart
@@ -13,7 +12,6 @@ from email.mime.base import MIMEBase
 from email.mime.text import MIMEText
 from email import encoders
 import zipfile
-import shutil
 import traceback
 import re
 from threading import Thread
@@ -29,7 +27,9 @@ app = Flask(__name__)
 UPLOAD_FOLDER = 'mashup_files'
 TEMP_FOLDER = 'temp_downloads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(TEMP_FOLDER, exist_ok=True)
+
+# Shared for the life of the process: worker pool, clip cache, encoder settings
+engine = MashupEngine(temp_dir=TEMP_FOLDER, fingerprint_path=FINGERPRINT_CACHE)
 
 # ============================================
 # EMAIL CONFIGURATION - UPDATE THESE!
@@ -52,95 +52,6 @@ def validate_email(email):
     return re.match(pattern, email) is not None
 
 
-def download_videos(singer_name, num_videos):
-    """Download videos from YouTube"""
-    try:
-        logger.info(f"Searching for {singer_name} videos...")
-        search = Search(singer_name)
-        video_urls = []
-        
-        for i, result in enumerate(search.results):
-            if i >= num_videos:
-                break
-            video_urls.append(result.watch_url)
-        
-        logger.info(f"Found {len(video_urls)} videos")
-        audio_files = []
-        
-        for i, url in enumerate(video_urls):
-            try:
-                logger.info(f"Downloading {i+1}/{len(video_urls)}: {url}")
-                yt = YouTube(url)
-                audio_stream = yt.streams.filter(only_audio=True).first()
-                
-                if audio_stream:
-                    output_file = audio_stream.download(
-                        output_path=TEMP_FOLDER,
-                        filename=f"audio_{i}.mp4"
-                    )
-                    audio_files.append(output_file)
-                    logger.info(f"Downloaded: {output_file}")
-                    
-            except Exception as e:
-                logger.error(f"Error downloading {url}: {str(e)}")
-                continue
-        
-        logger.info(f"Successfully downloaded {len(audio_files)} audio files")
-        return audio_files
-    
-    except Exception as e:
-        logger.error(f"Error in download_videos: {str(e)}")
-        return []
-
-
-def process_audio(audio_files, duration):
-    """Convert and cut audio files"""
-    processed_clips = []
-    
-    for i, audio_file in enumerate(audio_files):
-        try:
-            logger.info(f"Processing audio {i+1}/{len(audio_files)}")
-            audio_clip = AudioFileClip(audio_file)
-            
-            if audio_clip.duration > duration:
-                cut_clip = audio_clip.subclip(0, duration)
-            else:
-                cut_clip = audio_clip
-            
-            processed_clips.append(cut_clip)
-            
-        except Exception as e:
-            logger.error(f"Error processing {audio_file}: {str(e)}")
-            continue
-    
-    logger.info(f"Processed {len(processed_clips)} audio clips")
-    return processed_clips
-
-
-def merge_audio(clips, output_filename):
-    """Merge audio clips into single file"""
-    try:
-        logger.info("Merging audio clips...")
-        final_clip = concatenate_audioclips(clips)
-        final_clip.write_audiofile(
-            output_filename,
-            codec='libmp3lame',
-            bitrate='192k',
-            logger=None
-        )
-        
-        final_clip.close()
-        for clip in clips:
-            clip.close()
-        
-        logger.info(f"Mashup created: {output_filename}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error merging audio: {str(e)}")
-        return False
-
-
 def create_zip(mp3_file, zip_filename):
     """Create a zip file containing the MP3"""
     try:
@@ -232,47 +143,20 @@ This is an automated email. Please do not reply.
         return False
 
 
-def cleanup_files():
-    """Clean up temporary files"""
-    try:
-        if os.path.exists(TEMP_FOLDER):
-            shutil.rmtree(TEMP_FOLDER)
-            os.makedirs(TEMP_FOLDER)
-        logger.info("Cleanup completed")
-    except Exception as e:
-        logger.error(f"Error cleaning up: {str(e)}")
-
-
 def create_mashup_async(singer_name, num_videos, duration, email):
     """Background task to create mashup and send email"""
     try:
         logger.info(f"Starting mashup creation for {singer_name}")
         logger.info(f"Videos: {num_videos}, Duration: {duration}s, Email: {email}")
         
-        # Download videos
-        audio_files = download_videos(singer_name, num_videos)
-        
-        if not audio_files:
-            logger.error("No audio files downloaded")
-            cleanup_files()
-            return
-        
-        # Process audio
-        clips = process_audio(audio_files, duration)
-        
-        if not clips:
-            logger.error("No clips processed")
-            cleanup_files()
-            return
-        
-        # Merge audio
+        # Download, cut and merge
         safe_name = singer_name.replace(" ", "_").replace("/", "_")
         output_mp3 = os.path.join(UPLOAD_FOLDER, f'{safe_name}_mashup.mp3')
-        success = merge_audio(clips, output_mp3)
         
-        if not success:
-            logger.error("Failed to merge audio")
-            cleanup_files()
+        try:
+            engine.create_mashup(singer_name, num_videos, duration, output_mp3)
+        except MashupError as e:
+            logger.error(str(e))
             return
         
         # Create zip
@@ -288,13 +172,9 @@ def create_mashup_async(singer_name, num_videos, duration, email):
             logger.error(f"❌ Failed to send email to {email}")
             logger.error("Check the error messages above for details")
         
-        # Cleanup
-        cleanup_files()
-        
     except Exception as e:
         logger.error(f"Error in create_mashup_async: {str(e)}")
         traceback.print_exc()
-        cleanup_files()
 
 
 @app.route('/')
@@ -0,0 +1,303 @@
+"""
+Duplicate detection for search results.
+
+Two stages:
+
+1. ``TitleFilter`` runs before anything is downloaded. Titles are reduced
+   to a bag of meaningful words, minus the words of the search query that
+   every result shares (for the query "Sharry Maan", "Hostel (Official
+   Video)" and "Sharry Maan - Hostel | Lyrics" both become "hostel"), and
+   once the video length is known it is compared as well.
+
+2. ``FingerprintIndex`` runs on the decoded PCM clips. Each clip gets a
+   compact spectral fingerprint (32 bits per frame, one every ~23 ms) computed with
+   vectorized NumPy, and clips whose fingerprints match an already accepted
+   clip are dropped. The index keeps the most recently used videos and can
+   be saved and loaded, so fingerprints are computed once per video.
+"""
+
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+# --------------------------------------------------
+# Title Normalization
+# --------------------------------------------------
+NOISE_WORDS = {
+    "official", "video", "audio", "lyric", "lyrics", "lyrical", "music",
+    "full", "song", "songs", "hd", "hq", "4k", "1080p", "720p", "live",
+    "version", "visualizer", "visualiser", "remastered", "remaster", "mv",
+    "new", "latest", "original", "clip", "performance", "cover", "the",
+    "ft", "feat", "featuring", "with", "by", "x", "and", "from", "movie", "film"
+}
+
+_BRACKETS = re.compile(r"[\(\[\{【].*?[\)\]\}】]")
+_FEATURING = re.compile(r"\b(ft|feat|featuring)\b\.?.*?(?=[|\-–—]|$)")
+_YEAR = re.compile(r"^(19|20)\d\d$")
+_WORD = re.compile(r"\w+")
+
+
+def title_tokens(title):
+    """Meaningful words of a video title, lowercased and accent-free"""
+    title = unicodedata.normalize("NFKD", title or "")
+    title = "".join(c for c in title if not unicodedata.combining(c)).lower()
+    title = _BRACKETS.sub(" ", title)
+    title = _FEATURING.sub(" ", title)
+
+    return frozenset(
+        word for word in _WORD.findall(title)
+        if word not in NOISE_WORDS and not _YEAR.match(word)
+    )
+
+
+def normalize_title(title):
+    """Order-independent key; equal keys mean the same song"""
+    return " ".join(sorted(title_tokens(title)))
+
+
+# --------------------------------------------------
+# Stage 1: Title / Length Filter
+# --------------------------------------------------
+class TitleFilter:
+    """Cheap pre-download duplicate check on titles and lengths.
+
+    ``ignore`` holds words left out of every comparison, normally the
+    query's: all results of an artist search carry the artist's name, which
+    would otherwise make different songs look alike.
+    """
+
+    def __init__(self, ignore=frozenset(), length_tolerance=3, min_overlap=0.6):
+        self.ignore = frozenset(ignore)
+        self.length_tolerance = length_tolerance
+        self.min_overlap = min_overlap
+        self._entries = {}
+
+    def admit(self, video_id, title, length=None):
+        """Register a video; returns False if it duplicates one already admitted.
+
+        May be called again for the same video once its length is known.
+        """
+        # A title made only of ignored words still has to match exactly
+        tokens = title_tokens(title)
+        tokens = tokens - self.ignore or tokens
+        key = " ".join(sorted(tokens))
+
+        for other_id, (other_key, other_tokens, other_length) in self._entries.items():
+            if other_id == video_id:
+                continue
+
+            if key and key == other_key:
+                self._entries.pop(video_id, None)
+                return False
+
+            if length and other_length and abs(length - other_length) <= self.length_tolerance:
+                union = tokens | other_tokens
+                if union and len(tokens & other_tokens) / len(union) >= self.min_overlap:
+                    self._entries.pop(video_id, None)
+                    return False
+
+        self._entries[video_id] = (key, tokens, length)
+        return True
+
+    def discard(self, video_id):
+        """Forget a video (e.g. its download failed)"""
+        self._entries.pop(video_id, None)
+
+
+# --------------------------------------------------
+# Stage 2: Audio Fingerprints
+# --------------------------------------------------
+FP_SAMPLE_RATE = 11025
+FP_FRAME = 2048
+FP_HOP = 256
+FP_BANDS = 33
+FP_MIN_HZ = 300
+FP_MAX_HZ = 3000
+
+
+def _band_edges(sample_rate):
+    edges_hz = np.geomspace(FP_MIN_HZ, FP_MAX_HZ, FP_BANDS + 1)
+    return np.round(edges_hz * FP_FRAME / sample_rate).astype(np.intp)
+
+
+def fingerprint(samples, sample_rate):
+    """Packed 32-bit-per-frame fingerprint of int16 ``samples`` (frames x channels).
+
+    Downmixing and decimation reduce a reshaped view of the samples, so the
+    clip is never copied at its original rate.
+    """
+    step = max(1, int(round(sample_rate / FP_SAMPLE_RATE)))
+    rate = sample_rate / step
+
+    # Averaging each block of ``step`` frames doubles as the anti-alias filter
+    usable = len(samples) - len(samples) % step
+    blocks = samples[:usable].reshape(-1, step, samples.shape[1])
+    mono = blocks.mean(axis=(1, 2), dtype=np.float32)
+    if len(mono) < FP_FRAME + FP_HOP:
+        return np.empty((0, (FP_BANDS - 1) // 8), dtype=np.uint8)
+
+    frames = np.lib.stride_tricks.sliding_window_view(mono, FP_FRAME)[::FP_HOP]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FP_FRAME).astype(np.float32), axis=1)) ** 2
+
+    # Energy per log-spaced band via cumulative sums
+    edges = _band_edges(rate)
+    cumulative = np.concatenate(
+        [np.zeros((len(spectrum), 1), dtype=spectrum.dtype), np.cumsum(spectrum, axis=1)],
+        axis=1
+    )
+    energy = cumulative[:, edges[1:]] - cumulative[:, edges[:-1]]
+
+    # Sign of the band-energy difference across frequency and time
+    diff = energy[:, :-1] - energy[:, 1:]
+    bits = (diff[1:] - diff[:-1]) > 0
+
+    return np.packbits(bits, axis=1)
+
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Float64 bit-plane values transformed at once (~64 MB)
+_BATCH_VALUES = 1 << 23
+
+
+def _ones_prefix(fp, size):
+    """Running count of set bits per frame, padded to ``size + 1`` entries"""
+    counts = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(_POPCOUNT[fp].sum(axis=1), out=counts[1:len(fp) + 1])
+    counts[len(fp) + 1:] = counts[len(fp)]
+    return counts
+
+
+def bit_error_rates(a, others, max_offset=256, min_overlap=128):
+    """Lowest bit error rate of ``a`` against each of ``others`` over frame
+    offsets of +/- ``max_offset`` (1.0 where no offset overlaps enough).
+
+    The set bits shared at every offset come from one FFT cross-correlation
+    of the bit planes, so offsets are never looped over in Python.
+    """
+    rates = np.ones(len(others))
+    if not len(a) or not len(others):
+        return rates
+
+    bits = a.shape[1] * 8
+    longest = max(len(a), max(len(b) for b in others))
+    # Long enough that the circular correlation never wraps into max_offset
+    size = 1 << int(np.ceil(np.log2(longest + max_offset + 1)))
+
+    planes_a = np.zeros((bits, size))
+    planes_a[:, :len(a)] = np.unpackbits(a, axis=1).T
+    spectrum_a = np.fft.rfft(planes_a, axis=1).conj()
+    ones_a = _ones_prefix(a, size)
+
+    offsets = np.arange(-max_offset, max_offset + 1)
+    start_a = np.maximum(offsets, 0)
+    start_b = np.maximum(-offsets, 0)
+
+    batch = max(1, _BATCH_VALUES // (bits * size))
+    for first in range(0, len(others), batch):
+        group = others[first:first + batch]
+
+        planes = np.zeros((len(group), bits, size))
+        for i, b in enumerate(group):
+            planes[i, :, :len(b)] = np.unpackbits(b, axis=1).T
+        # shared[i, -d] = set bits shared by a[j + d] and b_i[j], summed over j
+        shared = np.fft.irfft((np.fft.rfft(planes, axis=2) * spectrum_a).sum(axis=1), n=size, axis=1)
+        shared = np.rint(shared[:, -offsets % size]).astype(np.int64)
+
+        lengths = np.array([len(b) for b in group])[:, None]
+        overlap = np.minimum(len(a) - start_a, lengths - start_b)
+        valid = overlap >= min_overlap
+        overlap = np.maximum(overlap, 1)
+
+        ones_b = np.stack([_ones_prefix(b, size) for b in group])
+        set_a = ones_a[np.minimum(start_a + overlap, size)] - ones_a[start_a]
+        set_b = (np.take_along_axis(ones_b, np.minimum(start_b + overlap, size), axis=1)
+                 - ones_b[:, start_b])
+
+        group_rates = np.where(valid, (set_a + set_b - 2 * shared) / (overlap * bits), 1.0)
+        rates[first:first + len(group)] = group_rates.min(axis=1)
+
+    return rates
+
+
+def bit_error_rate(a, b, max_offset=256, min_overlap=128):
+    """Lowest fraction of differing bits over frame offsets of +/- ``max_offset``"""
+    return float(bit_error_rates(a, [b], max_offset, min_overlap)[0])
+
+
+def _npz_path(path):
+    # np.savez_compressed appends .npz to any other name
+    path = os.fspath(path)
+    return path if path.endswith(".npz") else path + ".npz"
+
+
+class FingerprintIndex:
+    """Fingerprints keyed by video id, reusable across runs.
+
+    Holds at most ``max_entries`` videos; the least recently used are
+    evicted first. ``dirty`` is set whenever the index differs from what
+    was last saved or loaded.
+    """
+
+    def __init__(self, threshold=0.35, max_offset=256, max_entries=2000):
+        self.threshold = threshold
+        self.max_offset = max_offset
+        self.max_entries = max_entries
+        self.dirty = False
+        self._fingerprints = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._fingerprints
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def get(self, key):
+        fp = self._fingerprints.get(key)
+        if fp is not None:
+            self._fingerprints.move_to_end(key)
+        return fp
+
+    def add(self, key, fp):
+        self._fingerprints[key] = fp
+        self._fingerprints.move_to_end(key)
+        while len(self._fingerprints) > self.max_entries:
+            self._fingerprints.popitem(last=False)
+        self.dirty = True
+
+    def find_duplicate(self, fp, among):
+        """Key from ``among`` whose fingerprint matches ``fp``, or None"""
+        keys = [key for key in among if key in self._fingerprints and len(self._fingerprints[key])]
+        if not keys or not len(fp):
+            return None
+
+        rates = bit_error_rates(fp, [self._fingerprints[key] for key in keys], self.max_offset)
+        matches = np.flatnonzero(rates < self.threshold)
+        return keys[matches[0]] if len(matches) else None
+
+    def save(self, path):
+        """Write all fingerprints, oldest first, to ``path`` (".npz" is appended if missing)"""
+        keys = list(self._fingerprints)
+        arrays = [self._fingerprints[key] for key in keys]
+        np.savez_compressed(
+            _npz_path(path),
+            keys=np.array(keys, dtype=str),
+            lengths=np.array([len(a) for a in arrays], dtype=np.int64),
+            data=np.concatenate(arrays) if arrays else np.empty((0, 4), dtype=np.uint8)
+        )
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        index = cls(**kwargs)
+        with np.load(_npz_path(path)) as saved:
+            offsets = np.concatenate([[0], np.cumsum(saved["lengths"])])
+            data = saved["data"]
+            for i, key in enumerate(saved["keys"]):
+                index.add(str(key), data[offsets[i]:offsets[i + 1]])
+        index.dirty = False
+        return index
@@ -0,0 +1,558 @@
+"""
+Reusable in-process mashup engine.
+
+One ``MashupEngine`` is shared by the CLI and both web apps. It runs the
+search -> download -> cut -> merge pipeline through three pluggable
+backends and keeps its expensive resources warm for the life of the
+process:
+
+- a thread pool for downloads and ffmpeg decodes,
+- a cache of decoded PCM clips (see pcm_store), so a video used by an
+  earlier job is never downloaded or decoded again; it lives in
+  ``temp_dir``, which the engine owns, and is picked up again after a
+  restart,
+- the fingerprint index used for duplicate detection (see dedup),
+  optionally persisted to ``fingerprint_path`` after every job that
+  changed it,
+- the encoder settings.
+
+Backends:
+
+    SearchBackend    search(query)            -> iterator of Video
+    DownloadBackend  resolve(video)           -> fill in metadata (length)
+                     download(video, dest)    -> local file path
+    EncodeBackend    decode(source, dest, duration) -> PcmClip
+                     encode(clips, output)    -> pcm_store.EncodeResult
+
+``YouTubeSearch``/``YouTubeDownloader`` wrap pytubefix, ``LocalFiles``
+serves both roles from a directory of audio files for offline use, and
+``FfmpegEncoder`` wraps pcm_store.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pcm_store
+from dedup import TitleFilter, FingerprintIndex, fingerprint, title_tokens
+from profiling import NullProfiler
+
+
+logger = logging.getLogger(__name__)
+
+TEMP_DIR = "temp_downloads"
+
+# Where the CLI and web apps keep fingerprints between runs; next to the
+# code rather than the working directory, so every entry point shares it
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mashup_data")
+FINGERPRINT_CACHE = os.path.join(DATA_DIR, "fingerprints.npz")
+
+MashupResult = namedtuple("MashupResult", "output_filename clips duration")
+
+# Cached clips are stored as <sha1 of the cache key>.pcm
+_CACHED_CLIP = re.compile(r"[0-9a-f]{40}\.pcm")
+
+
+class MashupError(Exception):
+    """Raised when a mashup cannot be produced"""
+
+
+class Video:
+    """A search result, whichever backend produced it"""
+
+    def __init__(self, video_id, title, source, length=None):
+        self.video_id = video_id
+        self.title = title
+        self.source = source
+        self.length = length
+        # Backend-specific state carried from resolve() to download()
+        self.handle = None
+
+
+# --------------------------------------------------
+# Backend Interfaces
+# --------------------------------------------------
+class SearchBackend:
+    def search(self, query):
+        """Yield Video objects, best match first"""
+        raise NotImplementedError
+
+
+class DownloadBackend:
+    def resolve(self, video):
+        """Fetch metadata (at least length) before committing to a download"""
+        return video
+
+    def download(self, video, dest_dir, filename):
+        """Make the audio available locally and return its path"""
+        raise NotImplementedError
+
+
+class EncodeBackend:
+    def decode(self, source, dest, duration):
+        raise NotImplementedError
+
+    def encode(self, clips, output_filename):
+        raise NotImplementedError
+
+
+# --------------------------------------------------
+# YouTube Backends
+# --------------------------------------------------
+class YouTubeSearch(SearchBackend):
+    def __init__(self, max_pages=5):
+        self.max_pages = max_pages
+
+    def search(self, query):
+        from pytubefix import Search
+
+        search = Search(query)
+        seen = 0
+
+        for page in range(self.max_pages):
+            try:
+                if page:
+                    search.get_next_results()
+                results = search.results
+            except IndexError:
+                # pytubefix raises IndexError when there are no more pages
+                return
+
+            if len(results) == seen:
+                return
+
+            new_results = results[seen:]
+            seen = len(results)
+
+            for result in new_results:
+                # ONLY collect real videos
+                if hasattr(result, "watch_url"):
+                    yield Video(result.video_id, result.title, result.watch_url)
+
+
+class YouTubeDownloader(DownloadBackend):
+    def resolve(self, video):
+        from pytubefix import YouTube
+
+        yt = YouTube(video.source)
+        video.handle = yt.streams.filter(only_audio=True).first()
+        video.title = yt.title
+        video.length = yt.length
+        return video
+
+    def download(self, video, dest_dir, filename):
+        if video.handle is None:
+            raise MashupError("No audio stream")
+        return video.handle.download(output_path=dest_dir, filename=filename)
+
+
+# --------------------------------------------------
+# Local Files Backend
+# --------------------------------------------------
+AUDIO_EXTENSIONS = {".mp3", ".mp4", ".m4a", ".webm", ".wav", ".ogg", ".opus", ".flac", ".aac"}
+
+
+class LocalFiles(SearchBackend, DownloadBackend):
+    """Search and 'download' from a local directory, for offline use.
+
+    A file matches when every word of the query appears in its path;
+    the query "*" matches everything.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def search(self, query):
+        wanted = title_tokens(query) if query.strip() != "*" else frozenset()
+
+        for dirpath, _, filenames in sorted(os.walk(self.root)):
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].lower() not in AUDIO_EXTENSIONS:
+                    continue
+
+                path = os.path.join(dirpath, filename)
+                relpath = os.path.relpath(path, self.root)
+                if wanted - title_tokens(relpath.replace(os.sep, " ")):
+                    continue
+
+                # The path itself: any rewriting can map two files to one id
+                video_id = relpath.replace(os.sep, "/")
+                title = os.path.splitext(filename)[0]
+                yield Video(video_id, title, path)
+
+    def download(self, video, dest_dir, filename):
+        return video.source
+
+
+# --------------------------------------------------
+# Encoder
+# --------------------------------------------------
+class FfmpegEncoder(EncodeBackend):
+    def __init__(self, codec="libmp3lame", bitrate="192k", normalize=False,
+                 sample_rate=pcm_store.DEFAULT_SAMPLE_RATE,
+                 channels=pcm_store.DEFAULT_CHANNELS):
+        self.codec = codec
+        self.bitrate = bitrate
+        self.normalize = normalize
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    def decode(self, source, dest, duration):
+        return pcm_store.decode_clip(source, dest, duration, self.sample_rate, self.channels)
+
+    def encode(self, clips, output_filename):
+        return pcm_store.encode_clips(
+            clips,
+            output_filename,
+            codec=self.codec,
+            bitrate=self.bitrate,
+            normalize=self.normalize
+        )
+
+
+# --------------------------------------------------
+# Engine
+# --------------------------------------------------
+class MashupEngine:
+    """Long-lived mashup pipeline; safe to share between threads"""
+
+    def __init__(self, search_backend=None, download_backend=None, encoder=None,
+                 workers=4, temp_dir=TEMP_DIR, max_cache_bytes=1 << 30,
+                 fingerprint_path=None):
+        self.search_backend = search_backend or YouTubeSearch()
+        self.download_backend = download_backend or YouTubeDownloader()
+        self.encoder = encoder or FfmpegEncoder()
+        self.temp_dir = temp_dir
+        self.max_cache_bytes = max_cache_bytes
+
+        self.fingerprint_path = fingerprint_path
+        self.fingerprints = self._load_fingerprints()
+        self._clip_cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mashup")
+
+        os.makedirs(self.temp_dir, exist_ok=True)
+        self._reindex_clips()
+
+    @classmethod
+    def local(cls, root, **kwargs):
+        """Engine that never touches the network"""
+        backend = LocalFiles(root)
+        return cls(search_backend=backend, download_backend=backend, **kwargs)
+
+    # --------------------------------------------------
+    # Fingerprint Cache
+    # --------------------------------------------------
+    def _load_fingerprints(self):
+        if self.fingerprint_path and os.path.exists(self.fingerprint_path):
+            try:
+                return FingerprintIndex.load(self.fingerprint_path)
+            except Exception as e:
+                logger.error(f"Ignoring unreadable fingerprint cache {self.fingerprint_path}: {str(e)}")
+        return FingerprintIndex()
+
+    def save_fingerprints(self):
+        if not self.fingerprint_path or not self.fingerprints.dirty:
+            return
+
+        # Write a sibling file first so a crash never leaves a torn cache
+        tmp_path = self.fingerprint_path + ".tmp.npz"
+        with self._save_lock:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.fingerprint_path)), exist_ok=True)
+                with self._lock:
+                    self.fingerprints.save(tmp_path)
+                os.replace(tmp_path, self.fingerprint_path)
+            except OSError as e:
+                logger.error(f"Error saving fingerprint cache: {str(e)}")
+
+    # --------------------------------------------------
+    # Clip Cache
+    # --------------------------------------------------
+    def _cache_key(self, video, duration):
+        # Hashed so any video id makes a safe, distinct file name
+        key = f"{video.video_id}|{duration}|{self.encoder.sample_rate}|{self.encoder.channels}"
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _reindex_clips(self):
+        """Adopt clips cached by an earlier process and delete its leftovers"""
+        cached = []
+        for name in os.listdir(self.temp_dir):
+            path = os.path.join(self.temp_dir, name)
+            if not os.path.isfile(path):
+                continue
+
+            if _CACHED_CLIP.fullmatch(name):
+                try:
+                    pcm_store.PcmClip(path).close()
+                    cached.append((os.path.getmtime(path), name[:-len(".pcm")], path))
+                    continue
+                except (OSError, ValueError):
+                    pass
+
+            # Interrupted downloads and decodes, or an unreadable clip
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        for _, key, path in sorted(cached):
+            self._store_clip(key, path)
+
+    def _cached_clip(self, key):
+        with self._lock:
+            entry = self._clip_cache.get(key)
+            if entry is None:
+                return None
+            self._clip_cache.move_to_end(key)
+
+        try:
+            return pcm_store.PcmClip(entry[0])
+        except (OSError, ValueError):
+            with self._lock:
+                gone = self._clip_cache.pop(key, None)
+                if gone is not None:
+                    self._cache_bytes -= gone[1]
+            return None
+
+    def _store_clip(self, key, path):
+        size = os.path.getsize(path)
+        with self._lock:
+            old = self._clip_cache.pop(key, None)
+            if old is not None:
+                self._cache_bytes -= old[1]
+            self._clip_cache[key] = (path, size)
+            self._cache_bytes += size
+
+            # The newest clip always stays, even if it alone exceeds the cap
+            evicted = []
+            while self._cache_bytes > self.max_cache_bytes and len(self._clip_cache) > 1:
+                old_path, old_size = self._clip_cache.popitem(last=False)[1]
+                self._cache_bytes -= old_size
+                evicted.append(old_path)
+
+        for old_path in evicted:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    # --------------------------------------------------
+    # Pipeline
+    # --------------------------------------------------
+    def _fetch_clip(self, video, duration, title_filter, deferred, profiler):
+        """Resolve, download and decode one video; returns a PcmClip or None"""
+        key = self._cache_key(video, duration)
+
+        clip = self._cached_clip(key)
+        if clip is not None:
+            logger.info(f"Cached: {video.title[:60]}")
+            return clip
+
+        # Video ids need not be valid file names
+        job_file = uuid.uuid4().hex
+        source = None
+
+        try:
+            # Unavailable, private or age-restricted videos fail here
+            with profiler.stage("streams", video=video.video_id):
+                self.download_backend.resolve(video)
+
+            # Length is known now, so re-check before spending bandwidth
+            with self._lock:
+                admitted = title_filter.admit(video.video_id, video.title, video.length)
+                if not admitted:
+                    deferred.append(video)
+            if not admitted:
+                logger.info(f"Skipped duplicate: {video.title[:60]}")
+                return None
+
+            with profiler.stage("download", video=video.video_id) as record:
+                source = self.download_backend.download(video, self.temp_dir, job_file + ".mp4")
+                record["bytes"] = os.path.getsize(source)
+
+            # Decode into a private file, then publish it to the cache
+            tmp_path = os.path.join(self.temp_dir, job_file + ".pcm.part")
+            with profiler.stage("decode", video=video.video_id) as record:
+                clip = self.encoder.decode(source, tmp_path, duration)
+                record["audio_s"] = clip.duration
+                if clip.ffmpeg_cpu_s is not None:
+                    record["child_cpu_s"] = clip.ffmpeg_cpu_s
+
+            clip.close()
+            pcm_path = os.path.join(self.temp_dir, key + ".pcm")
+            os.replace(tmp_path, pcm_path)
+            self._store_clip(key, pcm_path)
+
+            logger.info(f"Downloaded: {video.title[:60]}")
+            return pcm_store.PcmClip(pcm_path)
+
+        except Exception as e:
+            with self._lock:
+                title_filter.discard(video.video_id)
+            logger.error(f"Error fetching {video.source}: {str(e)}")
+            return None
+
+        finally:
+            # Only delete downloads we own; local backends hand out originals
+            if source and os.path.dirname(os.path.abspath(source)) == os.path.abspath(self.temp_dir):
+                os.remove(source)
+
+    def _fingerprint(self, video, clip, profiler):
+        with self._lock:
+            fp = self.fingerprints.get(video.video_id)
+        if fp is None:
+            with profiler.stage("fingerprint", video=video.video_id):
+                fp = fingerprint(clip.samples, clip.sample_rate)
+            with self._lock:
+                self.fingerprints.add(video.video_id, fp)
+        return fp
+
+    def _process(self, video, duration, title_filter, deferred, profiler):
+        """Fetch and fingerprint one video; returns (None, None) on any failure"""
+        clip = self._fetch_clip(video, duration, title_filter, deferred, profiler)
+        if clip is None:
+            return None, None
+
+        try:
+            return clip, self._fingerprint(video, clip, profiler)
+        except Exception as e:
+            clip.close()
+            with self._lock:
+                title_filter.discard(video.video_id)
+            logger.error(f"Error fingerprinting {video.source}: {str(e)}")
+            return None, None
+
+    def collect_clips(self, query, num_videos, duration, profiler=None):
+        """Search and fetch until num_videos distinct clips exist (or results run out)"""
+        profiler = profiler or NullProfiler()
+        process = profiler.profiled(
+            lambda video: self._process(video, duration, title_filter, deferred, profiler)
+        )
+
+        title_filter = TitleFilter(ignore=title_tokens(query))
+        accepted = []
+        clips = []
+        # Title duplicates are kept, whether rejected on the search result or
+        # after resolve: if the video that shadowed one fails and is
+        # discarded, the duplicate becomes a candidate again
+        deferred = []
+
+        def admit(video):
+            with self._lock:
+                return title_filter.admit(video.video_id, video.title, video.length)
+
+        def next_batch(size):
+            batch = []
+            for video in list(deferred):
+                if len(batch) == size:
+                    return batch
+                if admit(video):
+                    deferred.remove(video)
+                    batch.append(video)
+
+            while len(batch) < size:
+                video = next(videos, None)
+                if video is None:
+                    break
+                if admit(video):
+                    batch.append(video)
+                else:
+                    deferred.append(video)
+                    logger.info(f"Skipped duplicate: {video.title[:60]}")
+            return batch
+
+        logger.info(f"Searching for {query}...")
+        videos = iter(self.search_backend.search(query))
+
+        try:
+            while len(clips) < num_videos:
+                with profiler.stage("search", query=query):
+                    batch = next_batch(num_videos - len(clips))
+
+                if not batch:
+                    break
+
+                logger.info(f"Fetching {len(batch)} videos...")
+                results = list(self._pool.map(process, batch))
+
+                try:
+                    for video, (clip, fp) in zip(batch, results):
+                        if clip is None:
+                            continue
+
+                        # Other jobs may be adding to (and evicting from) the index
+                        with profiler.stage("dedup", video=video.video_id, against=len(accepted)), self._lock:
+                            duplicate = self.fingerprints.find_duplicate(fp, accepted)
+                        if duplicate:
+                            logger.info(f"{video.title[:60]} sounds like {duplicate}, dropped")
+                            clip.close()
+                            continue
+
+                        accepted.append(video.video_id)
+                        clips.append(clip)
+
+                except Exception:
+                    # Closing twice is harmless; leaking a mapping is not
+                    for clip, _ in results:
+                        if clip is not None:
+                            clip.close()
+                    raise
+
+                if len(clips) < num_videos:
+                    logger.info(f"Backfilling {num_videos - len(clips)} more videos...")
+
+        except Exception:
+            for clip in clips:
+                clip.close()
+            raise
+
+        logger.info(f"Processed {len(clips)} audio clips")
+        return clips
+
+    def create_mashup(self, query, num_videos, duration, output_filename, profiler=None):
+        """Run the whole pipeline; returns a MashupResult or raises MashupError"""
+        profiler = profiler or NullProfiler()
+
+        clips = self.collect_clips(query, num_videos, duration, profiler)
+        self.save_fingerprints()
+        if not clips:
+            raise MashupError(f"No clips processed for {query}")
+
+        try:
+            logger.info("Merging audio clips...")
+            with profiler.stage("encode", clips=len(clips), output=output_filename) as record:
+                encoded = self.encoder.encode(clips, output_filename)
+                record["audio_s"] = encoded.duration
+                if encoded.ffmpeg_cpu_s is not None:
+                    record["child_cpu_s"] = encoded.ffmpeg_cpu_s
+        finally:
+            for clip in clips:
+                clip.close()
+
+        logger.info(f"Mashup created: {output_filename}")
+        return MashupResult(output_filename, len(clips), encoded.duration)
+
+    # --------------------------------------------------
+    # Lifetime
+    # --------------------------------------------------
+    def close(self):
+        self._pool.shutdown(wait=True)
+        with self._lock:
+            self._clip_cache.clear()
+            self._cache_bytes = 0
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,279 @@
+"""
+Decode-once PCM intermediate store.
+
+Every trimmed clip is decoded exactly once by ffmpeg into a raw PCM file
+(signed 16-bit little-endian, interleaved) preceded by a small header:
+
+    offset  size  field
+    0       4     magic  b"MPCM"
+    4       2     format version
+    6       2     channels
+    8       4     sample rate (Hz)
+    12      4     reserved
+
+Merging, normalization and encoding then read the samples through ``mmap``
+and NumPy views, so the audio is never decoded twice and resident memory
+stays bounded by the chunk size rather than the length of the mashup.
+"""
+
+import mmap
+import os
+import struct
+import subprocess
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+from moviepy.config import get_setting
+
+
+MAGIC = b"MPCM"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+SAMPLE_DTYPE = np.dtype("<i2")
+
+DEFAULT_SAMPLE_RATE = 44100
+DEFAULT_CHANNELS = 2
+
+# Frames handed to the encoder per write (~1.5 s of stereo audio)
+CHUNK_FRAMES = 65536
+
+# ffmpeg_cpu_s is the encoder process's own CPU time (None where unknown)
+EncodeResult = namedtuple("EncodeResult", "duration ffmpeg_cpu_s")
+
+
+def _ffmpeg_binary():
+    return get_setting("FFMPEG_BINARY")
+
+
+def _wait(proc):
+    """Reap ``proc``; returns (return code, CPU seconds used by that process).
+
+    os.wait4 reports the rusage of this one child, unlike os.times(), which
+    sums every child reaped by the process, including other threads' ones.
+    """
+    if not hasattr(os, "wait4"):  # Windows
+        return proc.wait(), None
+
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, usage.ru_utime + usage.ru_stime
+
+
+def _ffmpeg_error(errors):
+    """Tail of ffmpeg's stderr, which was spooled to a temporary file"""
+    errors.seek(0, os.SEEK_END)
+    errors.seek(max(0, errors.tell() - 2000))
+    return errors.read().decode(errors="replace").strip()
+
+
+# --------------------------------------------------
+# PCM Clip
+# --------------------------------------------------
+class PcmClip:
+    """Read-only, memory-mapped view of a decoded PCM file"""
+
+    def __init__(self, path):
+        self.path = path
+        # Set by decode_clip: CPU time of the ffmpeg process that made the file
+        self.ffmpeg_cpu_s = None
+        self._file = open(path, "rb")
+
+        try:
+            header = self._file.read(HEADER.size)
+            if len(header) != HEADER.size:
+                raise ValueError(f"{path}: truncated PCM header")
+
+            magic, version, channels, sample_rate, _ = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path}: not a PCM store file")
+
+            self.channels = channels
+            self.sample_rate = sample_rate
+
+            size = os.fstat(self._file.fileno()).st_size
+            frame_bytes = SAMPLE_DTYPE.itemsize * channels
+            self.num_frames = (size - HEADER.size) // frame_bytes
+
+            if self.num_frames:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.samples = np.frombuffer(
+                    self._map,
+                    dtype=SAMPLE_DTYPE,
+                    count=self.num_frames * channels,
+                    offset=HEADER.size
+                ).reshape(self.num_frames, channels)
+            else:
+                self._map = None
+                self.samples = np.empty((0, channels), dtype=SAMPLE_DTYPE)
+
+        except Exception:
+            self._file.close()
+            raise
+
+    @property
+    def duration(self):
+        return self.num_frames / self.sample_rate
+
+    def chunks(self, chunk_frames=CHUNK_FRAMES):
+        """Yield contiguous views of at most ``chunk_frames`` frames"""
+        for start in range(0, self.num_frames, chunk_frames):
+            yield self.samples[start:start + chunk_frames]
+
+    def peak(self):
+        """Largest absolute sample value, without materialising np.abs()"""
+        peak = 0
+        for chunk in self.chunks():
+            peak = max(peak, int(chunk.max()), -int(chunk.min()))
+        return peak
+
+    def close(self):
+        # Views must be released before the mapping can be closed
+        self.samples = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # A view is still alive somewhere (e.g. in a traceback); the
+                # mapping is released when the last view is garbage collected
+                pass
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --------------------------------------------------
+# Decode
+# --------------------------------------------------
+def decode_clip(source, dest, duration=None,
+                sample_rate=DEFAULT_SAMPLE_RATE, channels=DEFAULT_CHANNELS):
+    """Decode the first ``duration`` seconds of ``source`` into ``dest``"""
+    cmd = [_ffmpeg_binary(), "-v", "error", "-i", source]
+    if duration is not None:
+        cmd += ["-t", str(duration)]
+    cmd += [
+        "-vn",
+        "-f", "s16le",
+        "-acodec", "pcm_s16le",
+        "-ar", str(sample_rate),
+        "-ac", str(channels),
+        "pipe:1"
+    ]
+
+    # ffmpeg writes straight into dest after the header, and stderr goes to
+    # a temporary file, so neither pipe can fill up and block the other side
+    try:
+        with open(dest, "wb") as out, tempfile.TemporaryFile() as errors:
+            out.write(HEADER.pack(MAGIC, VERSION, channels, sample_rate, 0))
+            out.flush()
+
+            proc = subprocess.Popen(cmd, stdout=out, stderr=errors)
+            returncode, cpu = _wait(proc)
+            if returncode != 0:
+                raise RuntimeError(f"ffmpeg failed to decode {source}: {_ffmpeg_error(errors)}")
+
+        clip = PcmClip(dest)
+        clip.ffmpeg_cpu_s = cpu
+        if clip.num_frames == 0:
+            clip.close()
+            raise RuntimeError(f"No audio decoded from {source}")
+
+    except BaseException:
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise
+
+    return clip
+
+
+# --------------------------------------------------
+# Normalize
+# --------------------------------------------------
+def normalization_gain(clips, target_dbfs=-1.0):
+    """Gain that brings the loudest sample across ``clips`` to ``target_dbfs``"""
+    peak = max((clip.peak() for clip in clips), default=0)
+    if peak == 0:
+        return 1.0
+    return (32767 * 10 ** (target_dbfs / 20)) / peak
+
+
+def _apply_gain(chunk, gain):
+    scaled = np.multiply(chunk, gain, dtype=np.float32)
+    np.clip(scaled, -32768, 32767, out=scaled)
+    return scaled.astype(SAMPLE_DTYPE)
+
+
+# --------------------------------------------------
+# Merge & Encode
+# --------------------------------------------------
+def _write_chunks(stream, clips, gain):
+    # Kept in its own frame so no view into a mapping outlives the loop
+    for clip in clips:
+        for chunk in clip.chunks():
+            if gain != 1.0:
+                chunk = _apply_gain(chunk, gain)
+            stream.write(chunk)
+
+
+def encode_clips(clips, output_filename, codec="libmp3lame", bitrate="192k",
+                 normalize=False):
+    """Concatenate ``clips`` and stream them straight into the encoder.
+
+    Returns an EncodeResult with the seconds of audio written.
+    """
+    if not clips:
+        raise ValueError("No clips to encode")
+
+    sample_rate = clips[0].sample_rate
+    channels = clips[0].channels
+    for clip in clips:
+        if clip.sample_rate != sample_rate or clip.channels != channels:
+            raise ValueError(f"{clip.path}: PCM format does not match the first clip")
+
+    gain = normalization_gain(clips) if normalize else 1.0
+
+    cmd = [
+        _ffmpeg_binary(), "-v", "error", "-y",
+        "-f", "s16le",
+        "-ar", str(sample_rate),
+        "-ac", str(channels),
+        "-i", "pipe:0",
+        "-codec:a", codec,
+        "-b:a", bitrate,
+        output_filename
+    ]
+
+    with tempfile.TemporaryFile() as errors:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=errors)
+        try:
+            try:
+                _write_chunks(proc.stdin, clips, gain)
+            except BrokenPipeError:
+                # ffmpeg exited early; its return code and stderr say why
+                pass
+            except BaseException:
+                # Closing stdin would make ffmpeg finalize a truncated file
+                proc.kill()
+                _wait(proc)
+                raise
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+            returncode, cpu = _wait(proc)
+            if returncode != 0:
+                raise RuntimeError(f"ffmpeg failed to encode {output_filename}: {_ffmpeg_error(errors)}")
+
+        except BaseException:
+            if os.path.exists(output_filename):
+                os.remove(output_filename)
+            raise
+
+    return EncodeResult(sum(clip.duration for clip in clips), cpu)
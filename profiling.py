@@ -0,0 +1,317 @@
+"""
+Per-stage profiling for mashup runs.
+
+Every stage records wall time, CPU time spent in the calling thread, CPU
+time spent in the ffmpeg process it ran (``child_cpu_s``, set by the stage
+from that process's own rusage, so concurrent stages don't share it) and
+peak memory. Comparing the three time numbers tells where a slow run went:
+
+    wall >> cpu + child_cpu   -> waiting on the network
+    cpu dominates             -> our Python code
+    child_cpu dominates       -> ffmpeg decode / lame encode
+
+With ``capture=True`` the run is additionally profiled with cProfile and
+tracemalloc, and ``write()`` dumps everything to a JSON trace file that can
+be diffed between versions. Work handed to a thread pool should be wrapped
+with ``profiled()`` so cProfile follows it onto the worker threads.
+
+Peak memory per stage needs Linux: the resident-set high-water mark is
+reset through /proc/self/clear_refs when a stage starts and read back from
+VmHWM when it ends (``rss_peak_bytes``). Stages that overlap on worker
+threads share one reset, so their peak covers every stage that was running;
+the same goes for ``tracemalloc_peak_bytes``.
+Elsewhere only ``rss_peak_growth_bytes`` is recorded: how far the
+process-lifetime peak rose during the stage.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+TRACE_VERSION = 1
+
+
+def _rss_peak_bytes():
+    """Process-lifetime resident memory high-water mark"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _proc_status_bytes(field):
+    """A ``kB`` field of /proc/self/status in bytes, or None off Linux"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_rss_peak():
+    """Reset VmHWM to the current RSS; returns False if unsupported"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _child_cpu():
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+# --------------------------------------------------
+# Profiler
+# --------------------------------------------------
+class Profiler:
+    """Collects timings for named stages of a single run"""
+
+    def __init__(self, capture=False, top_functions=40):
+        self.capture = capture
+        self.top_functions = top_functions
+        self.stages = []
+        self.metadata = {}
+        self._profile = None
+        self._worker_profiles = []
+        self._started = None
+        self._finished = None
+        self._lock = threading.Lock()
+        self._active = 0
+        self._peak_reset = False
+        # VmHWM resets also reset ru_maxrss, so the run's peak is tracked here
+        self._rss_peak = _rss_peak_bytes()
+
+    def start(self, **metadata):
+        self.metadata.update(metadata)
+        self._started = (time.perf_counter(), time.process_time(), _child_cpu())
+
+        if self.capture:
+            tracemalloc.start()
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self):
+        if self._started is None or self._finished is not None:
+            return
+
+        if self._profile is not None:
+            self._profile.disable()
+
+        wall, cpu, child_cpu = self._started
+        self._finished = {
+            "wall_s": time.perf_counter() - wall,
+            "cpu_s": time.process_time() - cpu,
+            "child_cpu_s": _child_cpu() - child_cpu,
+            "rss_peak_bytes": self._track_peak(_rss_peak_bytes())
+        }
+
+        if self.capture and tracemalloc.is_tracing():
+            self._finished["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def _track_peak(self, peak):
+        if peak is not None:
+            with self._lock:
+                self._rss_peak = max(self._rss_peak or 0, peak)
+        return self._rss_peak
+
+    def _memory_start(self):
+        """Reset the memory peaks unless another stage is already running"""
+        tracing = self.capture and tracemalloc.is_tracing()
+
+        with self._lock:
+            if self._active == 0:
+                # Keep the peak reached so far before it is wiped
+                peak = _proc_status_bytes("VmHWM")
+                if peak is not None:
+                    self._rss_peak = max(self._rss_peak or 0, peak)
+                self._peak_reset = _reset_rss_peak()
+                if tracing:
+                    tracemalloc.reset_peak()
+            self._active += 1
+            peak_reset = self._peak_reset
+
+        traced_before = tracemalloc.get_traced_memory()[0] if tracing else None
+        return peak_reset, _rss_peak_bytes(), traced_before
+
+    def _memory_end(self, record, peak_reset, lifetime_peak, traced_before):
+        if peak_reset:
+            peak = _proc_status_bytes("VmHWM")
+            record["rss_peak_bytes"] = peak
+            self._track_peak(peak)
+        elif lifetime_peak is not None:
+            record["rss_peak_growth_bytes"] = _rss_peak_bytes() - lifetime_peak
+
+        if traced_before is not None and tracemalloc.is_tracing():
+            record["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1] - traced_before
+
+        with self._lock:
+            self._active -= 1
+
+    @contextmanager
+    def stage(self, name, **metadata):
+        """Time the enclosed block; extra keyword arguments are stored with it.
+
+        Stages that run ffmpeg should set ``record["child_cpu_s"]``.
+        """
+        record = {"name": name, "thread": threading.current_thread().name}
+        record.update(metadata)
+
+        memory = self._memory_start()
+
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+
+        try:
+            yield record
+            record.setdefault("ok", True)
+        except BaseException as e:
+            record["ok"] = False
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["wall_s"] = time.perf_counter() - wall
+            record["cpu_s"] = time.thread_time() - cpu
+            record.setdefault("child_cpu_s", 0.0)
+            self._memory_end(record, *memory)
+            self.stages.append(record)
+
+    def profiled(self, func):
+        """Wrap ``func`` so cProfile also covers it on a worker thread"""
+        # From 3.12 cProfile already sees every thread, and a second
+        # profiler cannot be enabled while the main one is running
+        if not self.capture or sys.version_info >= (3, 12):
+            return func
+
+        def wrapper(*args, **kwargs):
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._lock:
+                    self._worker_profiles.append(profile)
+
+        return wrapper
+
+    # --------------------------------------------------
+    # Reporting
+    # --------------------------------------------------
+    def totals(self):
+        """Wall/CPU totals per stage name, in first-seen order"""
+        totals = {}
+        for record in self.stages:
+            entry = totals.setdefault(record["name"], {
+                "count": 0,
+                "wall_s": 0.0,
+                "cpu_s": 0.0,
+                "child_cpu_s": 0.0,
+                "rss_peak_bytes": None
+            })
+            entry["count"] += 1
+            entry["wall_s"] += record["wall_s"]
+            entry["cpu_s"] += record["cpu_s"]
+            entry["child_cpu_s"] += record["child_cpu_s"]
+            if record.get("rss_peak_bytes") is not None:
+                entry["rss_peak_bytes"] = max(entry["rss_peak_bytes"] or 0, record["rss_peak_bytes"])
+        return totals
+
+    def summary(self):
+        def megabytes(value):
+            return f"{value / 2**20:.1f}" if value is not None else "-"
+
+        lines = [f"{'Stage':<12}{'Count':>6}{'Wall (s)':>11}{'CPU (s)':>10}{'ffmpeg (s)':>12}{'Peak RSS (MB)':>15}"]
+        for name, entry in self.totals().items():
+            lines.append(
+                f"{name:<12}{entry['count']:>6}{entry['wall_s']:>11.2f}"
+                f"{entry['cpu_s']:>10.2f}{entry['child_cpu_s']:>12.2f}"
+                f"{megabytes(entry['rss_peak_bytes']):>15}"
+            )
+        if self._finished:
+            lines.append(
+                f"{'total':<12}{'':>6}{self._finished['wall_s']:>11.2f}"
+                f"{self._finished['cpu_s']:>10.2f}{self._finished['child_cpu_s']:>12.2f}"
+                f"{megabytes(self._finished['rss_peak_bytes']):>15}"
+            )
+        return "\n".join(lines)
+
+    def _merged_stats(self):
+        stats = pstats.Stats(self._profile, stream=io.StringIO())
+        for profile in self._worker_profiles:
+            stats.add(profile)
+        return stats
+
+    def _cprofile_stats(self):
+        stats = self._merged_stats()
+
+        functions = []
+        for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+            functions.append({
+                "function": f"{filename}:{line}({func})",
+                "calls": nc,
+                "primitive_calls": cc,
+                "tottime_s": tt,
+                "cumtime_s": ct
+            })
+        functions.sort(key=lambda f: f["cumtime_s"], reverse=True)
+        return functions[:self.top_functions]
+
+    def to_dict(self):
+        trace = {
+            "version": TRACE_VERSION,
+            "metadata": self.metadata,
+            "total": self._finished,
+            "totals": self.totals(),
+            "stages": self.stages
+        }
+        if self._profile is not None:
+            trace["cprofile"] = self._cprofile_stats()
+        return trace
+
+    def write(self, path):
+        self.stop()
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+        # Raw stats as well, for snakeviz / pstats
+        if self._profile is not None:
+            self._merged_stats().dump_stats(os.path.splitext(path)[0] + ".prof")
+
+        return path
+
+
+class NullProfiler:
+    """Stand-in used when nobody asked for a profile.
+
+    Stages are not timed and, more importantly, never reset the process-wide
+    memory peak, which would corrupt the readings of a real Profiler running
+    in another thread.
+    """
+
+    @contextmanager
+    def stage(self, name, **metadata):
+        yield {}
+
+    def profiled(self, func):
+        return func
@@ -0,0 +1,163 @@
+import numpy as np
+import pytest
+
+from dedup import (
+    TitleFilter, FingerprintIndex, bit_error_rate, bit_error_rates, fingerprint, normalize_title, title_tokens
+)
+
+
+SAMPLE_RATE = 44100
+
+
+def song(seed, seconds=30):
+    """Four random tones per quarter second: crude, but song-like enough"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    signal = np.zeros_like(t)
+    for k in range(seconds * 4):
+        start = k * SAMPLE_RATE // 4
+        end = start + SAMPLE_RATE // 4
+        for freq in rng.uniform(200, 2800, 4):
+            signal[start:end] += np.sin(2 * np.pi * freq * t[start:end])
+    return signal / np.abs(signal).max() * 16000
+
+
+def pcm(signal):
+    mono = np.clip(signal, -32768, 32767).astype("<i2")
+    return np.stack([mono, mono], axis=1)
+
+
+def fp(signal):
+    return fingerprint(pcm(signal), SAMPLE_RATE)
+
+
+# --------------------------------------------------
+# Titles
+# --------------------------------------------------
+def test_title_noise_is_stripped():
+    assert normalize_title("Sharry Maan - Hostel (Official Video)") == "hostel maan sharry"
+    assert normalize_title("Hostel | Sharry Maan | Lyrics 2019") == "hostel maan sharry"
+    assert normalize_title("Sharry Maan: Hostel LIVE [HD]") == "hostel maan sharry"
+    assert title_tokens("Sharry Maan 3 Peg ft. Parmish Verma") == {"sharry", "maan", "3", "peg"}
+    assert title_tokens("Beyoncé") == {"beyonce"}
+
+
+def test_title_filter_rejects_same_song():
+    titles = TitleFilter()
+    assert titles.admit("a", "Sharry Maan - Hostel (Official Video)")
+    assert not titles.admit("b", "Hostel | Sharry Maan | Lyrics")
+    assert titles.admit("c", "Sharry Maan - 3 Peg")
+    # Re-admitting a video with its length is not a self-duplicate
+    assert titles.admit("a", "Sharry Maan - Hostel", length=200)
+
+
+def test_title_filter_uses_length():
+    titles = TitleFilter()
+    assert titles.admit("a", "Sharry Maan Hostel Punjabi", length=200)
+    assert not titles.admit("b", "Sharry Maan Hostel Punjabi Hit", length=203)
+    assert titles.admit("c", "Sharry Maan Hostel Punjabi Hit", length=260)
+
+
+def test_title_filter_ignores_query_words():
+    titles = TitleFilter(ignore=title_tokens("Shankar Ehsaan Loy"))
+    assert titles.admit("a", "Shankar Ehsaan Loy - Breathless", length=210)
+    assert titles.admit("b", "Shankar Ehsaan Loy - Koi", length=211)
+    assert not titles.admit("c", "Breathless (Official Video)")
+    # Without the query the shared artist name alone makes them alike
+    titles = TitleFilter()
+    assert titles.admit("a", "Shankar Ehsaan Loy - Breathless", length=210)
+    assert not titles.admit("b", "Shankar Ehsaan Loy - Koi", length=211)
+
+
+def test_title_filter_discard_frees_title():
+    titles = TitleFilter()
+    assert titles.admit("a", "Hostel")
+    titles.discard("a")
+    assert titles.admit("b", "Hostel (Lyrics)")
+
+
+# --------------------------------------------------
+# Fingerprints
+# --------------------------------------------------
+@pytest.fixture(scope="module")
+def original():
+    return song(1)
+
+
+@pytest.fixture(scope="module")
+def original_fp(original):
+    return fp(original)
+
+
+def test_fingerprint_shape(original_fp):
+    # 32 bits per frame, one frame every 256 samples at 11025 Hz
+    assert original_fp.dtype == np.uint8
+    assert original_fp.shape == (1283, 4)
+
+
+def test_noisy_copy_matches(original, original_fp):
+    rng = np.random.default_rng(9)
+    noise = rng.standard_normal(len(original)) * np.sqrt(np.mean(original ** 2) / 10 ** 3)
+    assert bit_error_rate(original_fp, fp(original + noise)) == pytest.approx(0.18, abs=0.03)
+
+
+def test_quieter_copy_matches(original, original_fp):
+    assert bit_error_rate(original_fp, fp(original * 0.3)) == pytest.approx(0.04, abs=0.03)
+
+
+def test_offset_copy_matches(original, original_fp):
+    assert bit_error_rate(original_fp, fp(original[3 * SAMPLE_RATE:])) == pytest.approx(0.06, abs=0.03)
+
+
+def test_offset_beyond_search_window_is_missed(original, original_fp):
+    # max_offset=256 frames covers about 5.9 s; an 8 s intro is not found
+    assert bit_error_rate(original_fp, fp(original[8 * SAMPLE_RATE:])) == pytest.approx(0.44, abs=0.03)
+
+
+def test_different_song_does_not_match(original_fp):
+    assert bit_error_rate(original_fp, fp(song(2))) == pytest.approx(0.45, abs=0.03)
+
+
+def test_batched_rates_match_pairwise(original, original_fp):
+    others = [fp(original[3 * SAMPLE_RATE:]), fp(song(2, seconds=10)), original_fp[:100]]
+    rates = bit_error_rates(original_fp, others)
+
+    assert rates[:2] == pytest.approx([bit_error_rate(original_fp, b) for b in others[:2]])
+    # Too short to reach min_overlap at any offset
+    assert rates[2] == 1.0
+
+
+def test_index_finds_duplicates(original, original_fp):
+    index = FingerprintIndex()
+    index.add("a", original_fp)
+    index.add("b", fp(song(2)))
+
+    assert index.find_duplicate(fp(original * 0.5), ["b", "a"]) == "a"
+    assert index.find_duplicate(fp(song(3)), ["a", "b"]) is None
+    assert index.find_duplicate(original_fp, ["missing"]) is None
+
+
+def test_index_evicts_least_recently_used(original_fp):
+    index = FingerprintIndex(max_entries=2)
+    index.add("a", original_fp)
+    index.add("b", original_fp)
+    index.get("a")
+    index.add("c", original_fp)
+
+    assert "a" in index and "c" in index
+    assert "b" not in index
+
+
+@pytest.mark.parametrize("name", ["fingerprints", "fingerprints.npz"])
+def test_index_save_load_round_trip(tmp_path, original_fp, name):
+    index = FingerprintIndex()
+    index.add("a", original_fp)
+    index.add("b", original_fp[:10])
+
+    path = str(tmp_path / name)
+    index.save(path)
+    loaded = FingerprintIndex.load(path)
+
+    assert len(loaded) == 2
+    assert np.array_equal(loaded.get("a"), original_fp)
+    assert np.array_equal(loaded.get("b"), original_fp[:10])
@@ -0,0 +1,224 @@
+import os
+
+import numpy as np
+import pytest
+
+import pcm_store
+from dedup import TitleFilter
+from engine import EncodeBackend, LocalFiles, MashupEngine, MashupError, Video
+import profiling
+from profiling import NullProfiler, Profiler
+
+from test_dedup import pcm, song
+
+
+class FakeEncoder(EncodeBackend):
+    """Decodes a file containing a song seed; files containing 'bad' fail"""
+
+    sample_rate = 44100
+    channels = 2
+
+    def __init__(self):
+        self.decoded = []
+
+    def decode(self, source, dest, duration):
+        with open(source) as f:
+            seed = f.read()
+        if seed == "bad":
+            raise RuntimeError("corrupt input")
+
+        self.decoded.append(os.path.basename(source))
+        samples = pcm(song(int(seed), seconds=duration))
+        with open(dest, "wb") as f:
+            f.write(pcm_store.HEADER.pack(pcm_store.MAGIC, pcm_store.VERSION, 2, self.sample_rate, 0))
+            f.write(samples.tobytes())
+        return pcm_store.PcmClip(dest)
+
+    def encode(self, clips, output_filename):
+        return pcm_store.EncodeResult(sum(clip.duration for clip in clips), None)
+
+
+@pytest.fixture
+def music(tmp_path):
+    root = tmp_path / "music"
+    root.mkdir()
+
+    def add(name, content):
+        (root / name).write_text(content)
+
+    return root, add
+
+
+def make_engine(tmp_path, root, **kwargs):
+    return MashupEngine.local(
+        str(root),
+        encoder=FakeEncoder(),
+        temp_dir=str(tmp_path / "temp"),
+        workers=2,
+        **kwargs
+    )
+
+
+def test_title_duplicate_backfills_after_decode_failure(tmp_path, music):
+    root, add = music
+    # Sorted first, so it shadows the working re-upload in the same batch
+    add("Singer - Song A (Audio).mp3", "bad")
+    add("Singer - Song A (Lyrics).mp3", "1")
+    add("Singer - Song B.mp3", "2")
+
+    with make_engine(tmp_path, root) as engine:
+        result = engine.create_mashup("singer", 2, 5, str(tmp_path / "out.mp3"))
+
+    assert result.clips == 2
+    assert sorted(engine.encoder.decoded) == ["Singer - Song A (Lyrics).mp3", "Singer - Song B.mp3"]
+
+
+def test_audio_duplicate_is_replaced(tmp_path, music):
+    root, add = music
+    add("Singer - First.mp3", "1")
+    add("Singer - Reupload.mp3", "1")
+    add("Singer - Second.mp3", "2")
+    add("Singer - Third.mp3", "3")
+
+    with make_engine(tmp_path, root) as engine:
+        result = engine.create_mashup("singer", 3, 5, str(tmp_path / "out.mp3"))
+
+    assert result.clips == 3
+    assert result.duration == pytest.approx(15)
+
+
+def test_no_matches_raises(tmp_path, music):
+    root, add = music
+    add("Other - Song.mp3", "1")
+
+    with make_engine(tmp_path, root) as engine:
+        with pytest.raises(MashupError):
+            engine.create_mashup("singer", 1, 5, str(tmp_path / "out.mp3"))
+
+
+def test_fingerprints_persist_between_engines(tmp_path, music):
+    root, add = music
+    add("Singer - Song A.mp3", "1")
+    cache = str(tmp_path / "data" / "fingerprints.npz")
+
+    with make_engine(tmp_path, root, fingerprint_path=cache) as engine:
+        engine.create_mashup("singer", 1, 5, str(tmp_path / "out.mp3"))
+        saved = engine.fingerprints.get("Singer - Song A.mp3")
+    assert saved is not None and len(saved)
+
+    written = os.stat(cache).st_mtime_ns
+    with make_engine(tmp_path, root, fingerprint_path=cache) as engine:
+        assert np.array_equal(engine.fingerprints.get("Singer - Song A.mp3"), saved)
+        # Nothing new was fingerprinted, so the cache is not rewritten
+        engine.create_mashup("singer", 1, 5, str(tmp_path / "out.mp3"))
+    assert os.stat(cache).st_mtime_ns == written
+
+
+class FlakyFiles(LocalFiles):
+    """Local backend where resolving 'Unavailable' videos raises"""
+
+    def resolve(self, video):
+        if "Unavailable" in video.title:
+            raise RuntimeError("VideoUnavailable")
+        return video
+
+
+def test_resolve_failure_skips_video(tmp_path, music):
+    root, add = music
+    for i in range(1, 6):
+        add(f"Singer - Song {i}.mp3", str(i))
+    add("Singer - Song 3 Unavailable.mp3", "9")
+    add("Singer - Song 6.mp3", "6")
+
+    backend = FlakyFiles(str(root))
+    engine = MashupEngine(backend, backend, FakeEncoder(), workers=4, temp_dir=str(tmp_path / "temp"))
+    with engine:
+        result = engine.create_mashup("singer", 6, 5, str(tmp_path / "out.mp3"))
+
+    assert result.clips == 6
+
+
+def test_profiled_run_stays_parallel(tmp_path, music):
+    root, add = music
+    for i in range(1, 5):
+        add(f"Singer - Song {i}.mp3", str(i))
+
+    profiler = Profiler(capture=True)
+    profiler.start()
+    with make_engine(tmp_path, root) as engine:
+        engine.create_mashup("singer", 4, 5, str(tmp_path / "out.mp3"), profiler)
+    profiler.stop()
+
+    decodes = [r for r in profiler.stages if r["name"] == "decode"]
+    assert len(decodes) == 4
+    assert all(r["thread"].startswith("mashup") for r in decodes)
+    assert len([r for r in profiler.stages if r["name"] == "dedup"]) == 4
+    functions = [f["function"] for f in profiler.to_dict()["cprofile"]]
+    assert any("_fetch_clip" in f for f in functions)
+
+
+def test_unprofiled_run_leaves_memory_peak_alone(tmp_path, music, monkeypatch):
+    root, add = music
+    add("Singer - Song A.mp3", "1")
+
+    def reset():
+        raise AssertionError("VmHWM reset without a profiler")
+
+    monkeypatch.setattr(profiling, "_reset_rss_peak", reset)
+    with make_engine(tmp_path, root) as engine:
+        engine.create_mashup("singer", 1, 5, str(tmp_path / "out.mp3"))
+
+
+def test_resolved_duplicate_is_deferred(tmp_path, music):
+    root, add = music
+    add("Singer - Song A.mp3", "1")
+    titles = TitleFilter()
+    titles.admit("first", "Singer - Song A", length=200)
+
+    video = Video("second", "Singer - Song A", str(root / "Singer - Song A.mp3"), length=201)
+    deferred = []
+    with make_engine(tmp_path, root) as engine:
+        assert engine._fetch_clip(video, 5, titles, deferred, NullProfiler()) is None
+
+    assert deferred == [video]
+
+
+def test_restart_reuses_cached_clips(tmp_path, music):
+    root, add = music
+    add("Singer - Song A.mp3", "1")
+    temp = tmp_path / "temp"
+
+    # No close(): a web app process just stops
+    first = make_engine(tmp_path, root)
+    first.create_mashup("singer", 1, 5, str(tmp_path / "out.mp3"))
+    first._pool.shutdown()
+    (temp / "0123_interrupted.pcm.part").write_bytes(b"x")
+
+    with make_engine(tmp_path, root) as engine:
+        names = os.listdir(temp)
+        assert len(names) == 1 and names[0].endswith(".pcm")
+        engine.create_mashup("singer", 1, 5, str(tmp_path / "out.mp3"))
+        assert engine.encoder.decoded == []
+
+
+def test_clip_cache_is_capped_by_bytes(tmp_path, music):
+    root, add = music
+    for i in range(1, 4):
+        add(f"Singer - Song {i}.mp3", str(i))
+    clip_bytes = pcm_store.HEADER.size + 5 * 44100 * 4
+
+    with make_engine(tmp_path, root, max_cache_bytes=2 * clip_bytes) as engine:
+        engine.create_mashup("singer", 3, 5, str(tmp_path / "out.mp3"))
+        assert engine._cache_bytes == 2 * clip_bytes
+        assert len([name for name in os.listdir(tmp_path / "temp") if name.endswith(".pcm")]) == 2
+
+
+def test_similar_file_names_stay_distinct(tmp_path, music):
+    root, add = music
+    add("Singer - Song (A).mp3", "1")
+    add("Singer - Song A.mp3", "2")
+
+    with make_engine(tmp_path, root) as engine:
+        result = engine.create_mashup("singer", 2, 5, str(tmp_path / "out.mp3"))
+
+    assert result.clips == 2
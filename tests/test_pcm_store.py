@@ -0,0 +1,157 @@
+import os
+import stat
+import sys
+
+import numpy as np
+import pytest
+
+import pcm_store
+
+
+def write_pcm(path, samples, sample_rate=44100):
+    with open(path, "wb") as f:
+        f.write(pcm_store.HEADER.pack(pcm_store.MAGIC, pcm_store.VERSION, samples.shape[1], sample_rate, 0))
+        f.write(samples.astype("<i2").tobytes())
+    return str(path)
+
+
+def tone(seconds=2.0, sample_rate=44100, freq=440.0):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    x = (np.sin(2 * np.pi * freq * t) * 12000).astype("<i2")
+    return np.stack([x, -x], axis=1)
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """ffmpeg stand-in that floods stderr, swallows stdin and exits 1"""
+    script = tmp_path / "ffmpeg"
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        "sys.stderr.write('error while decoding frame\\n' * 20000)\n"
+        "if 'pipe:0' in sys.argv:\n"
+        "    sys.stdin.buffer.read()\n"
+        "sys.exit(1)\n"
+    )
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(pcm_store, "_ffmpeg_binary", lambda: str(script))
+    return script
+
+
+def test_header_and_views(tmp_path):
+    samples = tone()
+    with pcm_store.PcmClip(write_pcm(tmp_path / "a.pcm", samples)) as clip:
+        assert (clip.sample_rate, clip.channels, clip.num_frames) == (44100, 2, len(samples))
+        assert clip.duration == pytest.approx(2.0)
+        assert np.array_equal(clip.samples, samples)
+
+        chunks = list(clip.chunks(10000))
+        assert sum(len(c) for c in chunks) == len(samples)
+        assert all(np.shares_memory(c, clip.samples) for c in chunks)
+
+
+def test_peak_handles_int16_minimum(tmp_path):
+    samples = np.zeros((100, 2), dtype="<i2")
+    samples[50, 1] = -32768
+    with pcm_store.PcmClip(write_pcm(tmp_path / "a.pcm", samples)) as clip:
+        assert clip.peak() == 32768
+
+
+def test_rejects_foreign_file(tmp_path):
+    path = tmp_path / "a.pcm"
+    path.write_bytes(b"RIFF" + bytes(100))
+    with pytest.raises(ValueError):
+        pcm_store.PcmClip(str(path))
+
+
+def test_close_with_outstanding_view(tmp_path):
+    clip = pcm_store.PcmClip(write_pcm(tmp_path / "a.pcm", tone()))
+    view = clip.samples[:10]
+    clip.close()
+    assert view.sum() is not None
+
+
+def test_encode_decode_round_trip(tmp_path):
+    samples = tone()
+    with pcm_store.PcmClip(write_pcm(tmp_path / "a.pcm", samples)) as clip:
+        result = pcm_store.encode_clips([clip, clip], str(tmp_path / "out.wav"), codec="pcm_s16le")
+    assert result.duration == pytest.approx(4.0)
+
+    decoded = pcm_store.decode_clip(str(tmp_path / "out.wav"), str(tmp_path / "b.pcm"), duration=3)
+    with decoded:
+        assert decoded.duration == pytest.approx(3.0)
+        if hasattr(os, "wait4"):
+            assert decoded.ffmpeg_cpu_s > 0
+        assert np.array_equal(decoded.samples[:len(samples)], samples)
+
+
+def test_decode_failure_removes_dest(tmp_path):
+    source = tmp_path / "broken.mp4"
+    source.write_bytes(os.urandom(4096))
+    dest = tmp_path / "broken.pcm"
+
+    with pytest.raises(RuntimeError):
+        pcm_store.decode_clip(str(source), str(dest))
+    assert not dest.exists()
+
+
+def test_missing_ffmpeg_removes_dest(tmp_path, monkeypatch):
+    monkeypatch.setattr(pcm_store, "_ffmpeg_binary", lambda: str(tmp_path / "no-such-ffmpeg"))
+    dest = tmp_path / "a.pcm"
+
+    with pytest.raises(FileNotFoundError):
+        pcm_store.decode_clip("in.mp4", str(dest))
+    assert not dest.exists()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="needs an executable script")
+def test_noisy_decode_failure_does_not_block(tmp_path, fake_ffmpeg):
+    with pytest.raises(RuntimeError, match="error while decoding"):
+        pcm_store.decode_clip("in.mp4", str(tmp_path / "a.pcm"))
+
+
+@pytest.mark.skipif(os.name == "nt", reason="needs an executable script")
+def test_encode_failure_leaves_clips_closable(tmp_path, fake_ffmpeg):
+    clips = [pcm_store.PcmClip(write_pcm(tmp_path / f"{i}.pcm", tone())) for i in range(2)]
+
+    with pytest.raises(RuntimeError, match="error while decoding"):
+        pcm_store.encode_clips(clips, str(tmp_path / "out.mp3"))
+
+    for clip in clips:
+        clip.close()
+
+
+def test_interrupted_encode_removes_output(tmp_path, monkeypatch):
+    output = tmp_path / "out.wav"
+    procs = []
+    popen = pcm_store.subprocess.Popen
+
+    def spawn(*args, **kwargs):
+        procs.append(popen(*args, **kwargs))
+        return procs[-1]
+
+    monkeypatch.setattr(pcm_store.subprocess, "Popen", spawn)
+
+    def interrupt(stream, clips, gain):
+        stream.write(clips[0].samples[:1000])
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(pcm_store, "_write_chunks", interrupt)
+
+    with pcm_store.PcmClip(write_pcm(tmp_path / "a.pcm", tone())) as clip:
+        with pytest.raises(KeyboardInterrupt):
+            pcm_store.encode_clips([clip], str(output), codec="pcm_s16le")
+
+    assert procs[0].returncode is not None
+    assert not output.exists()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="needs an executable script")
+def test_encode_failure_removes_output(tmp_path, fake_ffmpeg):
+    output = tmp_path / "out.mp3"
+    output.write_bytes(b"partial")
+
+    with pcm_store.PcmClip(write_pcm(tmp_path / "a.pcm", tone())) as clip:
+        with pytest.raises(RuntimeError):
+            pcm_store.encode_clips([clip], str(output))
+    assert not output.exists()
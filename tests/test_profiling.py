@@ -0,0 +1,55 @@
+import json
+
+import numpy as np
+import pytest
+
+import profiling
+from profiling import Profiler
+
+
+def test_stage_records_failure():
+    profiler = Profiler()
+    profiler.start()
+
+    with pytest.raises(ValueError):
+        with profiler.stage("download", video="abc"):
+            raise ValueError("unavailable")
+
+    record = profiler.stages[0]
+    assert record["ok"] is False
+    assert record["video"] == "abc"
+    assert record["error"] == "ValueError: unavailable"
+
+
+@pytest.mark.skipif(not profiling._reset_rss_peak(), reason="needs /proc/self/clear_refs")
+def test_rss_peak_is_per_stage():
+    profiler = Profiler()
+    profiler.start()
+
+    with profiler.stage("big"):
+        data = np.ones(2**25)  # 256 MB
+        del data
+    with profiler.stage("small"):
+        pass
+
+    profiler.stop()
+    big, small = profiler.stages
+    assert big["rss_peak_bytes"] - small["rss_peak_bytes"] > 200 * 2**20
+    assert profiler.to_dict()["total"]["rss_peak_bytes"] >= big["rss_peak_bytes"]
+
+
+def test_trace_file(tmp_path):
+    profiler = Profiler(capture=True)
+    profiler.start(singer="test")
+    with profiler.stage("encode"):
+        sum(range(1000))
+
+    path = profiler.write(str(tmp_path / "trace.json"))
+
+    with open(path) as f:
+        trace = json.load(f)
+    assert trace["metadata"] == {"singer": "test"}
+    assert trace["totals"]["encode"]["count"] == 1
+    assert "tracemalloc_peak_bytes" in trace["stages"][0]
+    assert trace["cprofile"]
+    assert (tmp_path / "trace.prof").exists()